@@ -0,0 +1,57 @@
+"""Measure how fast feed entries are delivered into a Maildir.
+
+Usage: PYTHONPATH=. python benchmarks/entry_messages.py [ENTRIES]
+"""
+
+from mrss import DictState, Mailbox
+from mrss._mailbox import Job
+from time import perf_counter
+from xml.etree.ElementTree import Element, SubElement, tostring
+import feedparser
+import mailbox
+import os
+import sys
+import tempfile
+
+
+def make_feed(count: int) -> bytes:
+    rss = Element("rss")
+    channel = SubElement(rss, "channel")
+    SubElement(channel, "title").text = "Feed Title"
+    SubElement(channel, "link").text = "http://example.com/"
+    for i in range(count):
+        item = SubElement(channel, "item")
+        SubElement(item, "pubDate").text = "Sat, 01 Jan 2000 00:00:00 GMT"
+        SubElement(item, "title").text = f"Entry {i}"
+        SubElement(item, "link").text = f"http://example.com/entry/{i}"
+        SubElement(item, "guid").text = f"http://example.com/entry/{i}"
+        SubElement(item, "description").text = "<p>Description</p>" * 10
+    return tostring(rss, encoding="utf-8", xml_declaration=True)
+
+
+def main():
+    count = int(sys.argv[1]) if 1 < len(sys.argv) else 10_000
+
+    result = feedparser.parse(make_feed(count))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        state = DictState()
+        state.load()
+        m = Mailbox(mailbox=mailbox.Maildir(os.path.join(tmp, "mail")), state=state)
+        job = Job(key="bench", data=None)
+
+        best = float("inf")
+        for _ in range(3):
+            # Deliver every entry again.
+            m._msgid2key = {}
+            start = perf_counter()
+            m._prepare_feed(job, state.get(job.key), result.feed)
+            for entry in result.entries:
+                m._add_msg(m._generate_entry_msg(entry, result.feed, job))
+            best = min(best, perf_counter() - start)
+
+    print(f"{count} entries in {best:.3f}s, {count / best:.0f} entries/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
 from ._mixins import SitesMixin, UserAgentMixin, EasyMaildir
 from ._mailbox import Mailbox
 from ._maildir import Maildir
-from ._state import State, DictState, GzipState
+from ._ratelimit import RateLimiter
+from ._replay import Archive, Recorder, ReplayServer
+from ._seen import SeenSet
+from ._state import State, DictState, GzipState, StateColumns
 
 from datetime import datetime
 import feedparser
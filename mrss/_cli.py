@@ -0,0 +1,234 @@
+from ._mixins import EasyMaildir, SitesMixin
+from ._ratelimit import RateLimiter
+from ._replay import Archive, Recorder, ReplayServer
+from ._utils import human_duration, parse_duration
+from contextlib import nullcontext
+from datetime import timedelta
+from statistics import quantiles
+from typing import Optional
+import argparse
+import logging
+import os
+
+FEED_KINDS = {
+    "url",
+    "shell",
+    *(x for x in SitesMixin.__dict__ if not x.startswith("_")),
+}
+
+
+def default_config():
+    config_home = os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config")
+    return os.path.join(config_home, "mrss", "feeds.toml")
+
+
+def load_config(filename: str) -> dict:
+    if filename.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise SystemExit("PyYAML is required to read YAML configuration")
+
+        with open(filename, "rb") as f:
+            return yaml.safe_load(f) or {}
+
+    try:
+        import tomllib
+    except ImportError:  # pragma: no cover
+        import tomli as tomllib
+
+    with open(filename, "rb") as f:
+        return tomllib.load(f)
+
+
+def parse_expires(x):
+    if isinstance(x, (int, float)):
+        return timedelta(seconds=x)
+    elif isinstance(x, str):
+        return timedelta(seconds=parse_duration(x))
+    return x
+
+
+def add_feed(m, spec: dict):
+    spec = dict(spec)
+
+    kinds = [x for x in spec if x in FEED_KINDS]
+    if len(kinds) != 1:
+        raise ValueError(
+            "Feed must have exactly one of %s: %r"
+            % (", ".join(sorted(FEED_KINDS)), spec)
+        )
+    kind = kinds[0]
+    value = spec.pop(kind)
+
+    if "expires" in spec:
+        spec["expires"] = parse_expires(spec["expires"])
+
+    if kind == "shell":
+        return m.shell(cmd=value, **spec)
+    return getattr(m, kind)(value, **spec)
+
+
+def print_stats(columns, *, top: int = 10):
+    print(f"Feeds: {len(columns)}")
+    print(f"Failing: {len(columns.failing())}")
+    for label, within in [
+        ("now", timedelta()),
+        ("in 1h", timedelta(hours=1)),
+        ("in 1d", timedelta(days=1)),
+    ]:
+        print(f"Due {label}: {columns.count_due(within)}")
+
+    print("\nHosts due in 1d:")
+    for host, count in columns.host_counts(timedelta(days=1)).most_common(top):
+        print(f"{count:8d}  {host}")
+
+    if 2 <= len(ages := columns.modified_ages()):
+        print("\nModified ago:")
+        deciles = quantiles(ages, n=10)
+        for label, secs in [
+            ("p10", deciles[0]),
+            ("p50", deciles[4]),
+            ("p90", deciles[8]),
+        ]:
+            print(f"{label:>8}  {human_duration(secs)}")
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(
+        prog="mrss",
+        description="Convert RSS feeds to email messages.",
+    )
+    parser.add_argument(
+        "-c",
+        "--config",
+        default=default_config(),
+        help="feed list in TOML or YAML format (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="number of feeds to fetch in parallel",
+    )
+    parser.add_argument(
+        "--budget",
+        help="stop starting new fetches after this long, e.g. 4m 30s",
+    )
+    parser.add_argument(
+        "-n",
+        "--dry-run",
+        action="store_true",
+        help="print due feeds without fetching them",
+    )
+    parser.add_argument(
+        "--only-due",
+        action="store_true",
+        help="exit without locking the mailbox if no feeds are due",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="print statistics of the state and exit",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="keep running and fetch feeds when they expire",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="DIR",
+        help="save responses to DIR",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="DIR",
+        help="serve responses saved by --record instead of fetching",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="delay replayed responses by this many seconds",
+    )
+    parser.add_argument(
+        "--bandwidth",
+        type=float,
+        help="send replayed responses at this many bytes per second",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="count",
+        default=0,
+    )
+    return parser
+
+
+def main(argv: Optional[list[str]] = None):
+    args = make_parser().parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(name)s: %(message)s",
+    )
+
+    config = load_config(args.config)
+
+    m = EasyMaildir(
+        config["maildir"],
+        statefile=config.get("statefile", "state.gz"),
+        seenfile=config.get("seenfile"),
+        rate_limit=RateLimiter(
+            rate=config.get("rate_limit"),
+            burst=config.get("burst", 1),
+        ),
+    )
+    m.USER_AGENT = config.get("user_agent")
+    m.workers = args.jobs or config.get("workers", 1)
+    if budget := args.budget or config.get("budget"):
+        m.budget = parse_expires(budget)
+
+    def feeds(m):
+        for spec in config.get("feeds") or []:
+            add_feed(m, spec)
+
+    if args.stats:
+        m.state.load()
+        print_stats(m.state.columns())
+        return 0
+
+    replay = nullcontext()
+    if args.replay:
+        replay = m.fetcher = ReplayServer(
+            Archive(args.replay),
+            latency=args.latency,
+            bandwidth=args.bandwidth,
+        )
+    elif args.record:
+        m.fetcher = Recorder(Archive(args.record))
+
+    if args.daemon:
+        with replay:
+            m.run_forever(feeds)
+        return 0
+
+    jobs = m.collect(feeds)
+
+    if args.dry_run or args.only_due:
+        m.state.load()
+        jobs = m.due(jobs)
+
+    if args.dry_run:
+        for job in jobs:
+            print(job.key)
+        return 0
+
+    if args.only_due and not jobs:
+        return 0
+
+    with replay, m:
+        m.run(jobs)
+
+    return 0
@@ -0,0 +1,81 @@
+from html.parser import HTMLParser
+from typing import Optional
+import re
+
+_DATA_URI = re.compile(
+    r"data:[\w.+-]+/[\w.+-]+(?:;[\w.+-]+(?:=[\w.+-]+)?)*,[^\"')\s>]*"
+)
+
+
+def strip_data_uris(html: str) -> str:
+    """Remove inline data: URIs, such as base64 encoded images."""
+    return _DATA_URI.sub("", html)
+
+
+class _TextExtractor(HTMLParser):
+    BLOCK_TAGS = set("""
+        address article blockquote br dd div dl dt figcaption h1 h2 h3 h4 h5
+        h6 hr li ol p pre section table tr ul
+        """.split())
+    SKIP_TAGS = {"script", "style", "template"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self.skip += 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self.skip = max(0, self.skip - 1)
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self.skip:
+            self.parts.append(data)
+
+    def text(self):
+        lines = (" ".join(line.split()) for line in "".join(self.parts).split("\n"))
+        return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def html_to_text(html: str) -> str:
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return parser.text()
+
+
+def truncate(text: str, max_size: int, link: Optional[str] = None) -> str:
+    """Truncate `text` to at most `max_size` UTF-8 bytes."""
+    data = text.encode()
+    if len(data) <= max_size:
+        return text
+
+    tail = "\n\n[…]" + (f" {link}" if link else "")
+    size = max(0, max_size - len(tail.encode()))
+    return data[:size].decode(errors="ignore").rstrip() + tail
+
+
+def trim_content(
+    value: str,
+    subtype: str,
+    max_size: int,
+    link: Optional[str] = None,
+) -> tuple[str, str]:
+    """Make body at most `max_size` bytes.
+
+    HTML that is still too large without data: URIs is converted to text.
+    """
+    if subtype == "html":
+        value = strip_data_uris(value)
+        if len(value.encode()) <= max_size:
+            return value, subtype
+        value, subtype = html_to_text(value), "plain"
+    return truncate(value, max_size, link), subtype
@@ -1,47 +1,309 @@
+from ._content import html_to_text, trim_content, truncate
+from ._profile import Profiler
+from ._ratelimit import RateLimiter
+from ._seen import SeenSet, entry_fingerprints
 from ._state import State
 from ._utils import human_duration
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from email.message import EmailMessage
+from email.headerregistry import HeaderRegistry
+from email.policy import default as default_policy
 from email.utils import formataddr, formatdate, parsedate_to_datetime
 from hashlib import sha1
-from time import mktime
-from typing import Callable, Optional, Union
+from heapq import heapify, heappop, heappush
+from time import mktime, monotonic, sleep, time
+from typing import Callable, Iterable, Optional, Union
 from urllib.parse import urlparse
 import feedparser
 import logging
 import mailbox
+import os
 import re
+import socket
 import subprocess
 
 
+class _HeaderRegistry(HeaderRegistry):
+    """HeaderRegistry that does not create a new class on every lookup."""
+
+    def __init__(self):
+        super().__init__()
+        self._classes = {}
+
+    def __getitem__(self, name):
+        name = name.lower()
+        if (cls := self._classes.get(name)) is None:
+            cls = self._classes[name] = super().__getitem__(name)
+        return cls
+
+
+_POLICY = default_policy.clone(header_factory=_HeaderRegistry())
+
+
+def _header(name: str, value: str):
+    """Parse header once so it can be assigned to many messages."""
+    return _POLICY.header_factory(name, value)
+
+
+@dataclass(slots=True, kw_only=True)
+class Job:
+    key: str
+    data: Callable[[], str]
+    expires: Union[timedelta, datetime] = timedelta()
+    name: Optional[str] = None
+    reply_to: bool = True
+    user_agent: Optional[str] = None
+    # Maximum size of message body in bytes.
+    max_size: Optional[int] = None
+    # Add a text/plain alternative to HTML messages.
+    summary: bool = False
+    # Feeds with higher priority are fetched first when time is limited.
+    priority: int = 0
+
+
 class Mailbox:
+    # Changing it changes Message-ID of every message, so existing messages
+    # would be delivered again.
+    MSGID_HASH = sha1
+
+    # Delay after the first failure, doubled after each consecutive one.
+    BACKOFF = timedelta(minutes=30)
+    MAX_BACKOFF = timedelta(days=7)
+
     def __init__(
         self,
         *,
         mailbox: mailbox.Mailbox,
         state: State,
+        rate_limit: Optional[RateLimiter] = None,
+        seen: Optional[SeenSet] = None,
+        fetcher: Optional[Callable] = None,
+        profiler: Optional[Profiler] = None,
+        budget: Optional[timedelta] = None,
+        workers: int = 1,
     ):
         self.mailbox = mailbox
         self.state = state
+        self.rate_limit = rate_limit or RateLimiter()
+        self.seen = seen
+        # Called as fetcher(key, data, **kwargs) instead of
+        # feedparser.parse(data(), **kwargs).
+        self.fetcher = fetcher
+        if not profiler and (x := os.environ.get("MRSS_PROFILE")):
+            profiler = Profiler(x)
+        self.profiler = profiler
+        if profiler:
+            self._fetch = profiler.wrap(self._fetch)
+            self._deliver = profiler.wrap(self._deliver)
         self.log = logging.getLogger(type(self).__name__)
+        # Feeds are run at the end of `with` block when time is limited.
+        self.budget = budget
+        # Number of feeds fetched in parallel by default.
+        self.workers = workers
+        self._deadline = None
+        self._jobs = None
+        self._received_hdr = None
 
     def __enter__(self):
+        if self.profiler:
+            self.profiler.start()
         self.mailbox.lock()
         self._msgid2key = None
+        self._received_hdr = None
         self._state_dirty = False
         self.state.load()
+        if self.seen:
+            self.seen.load()
+        if self.budget is not None:
+            self._deadline = monotonic() + self.budget.total_seconds()
+            self._jobs = {}
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb, /):
-        self.mailbox.flush()
-        self.mailbox.unlock()
-        self._msgid2key = None
-        if exc_type is None and self._state_dirty:
+        jobs, self._jobs = self._jobs, None
+        try:
+            if exc_type is None and jobs:
+                self.run(jobs.values())
+        finally:
+            self._deadline = None
+            self.mailbox.flush()
+            try:
+                if self._msgid2key is not None:
+                    self._save_msgids()
+            finally:
+                self._msgid2key = None
+                self.mailbox.unlock()
+        if exc_type is None:
+            self._checkpoint()
+        if self.profiler:
+            self.profiler.stop()
+
+    def _checkpoint(self):
+        if self._state_dirty:
             self.state.save()
+            self._state_dirty = False
+        if self.seen:
+            self.seen.save()
+
+    def collect(self, feeds: Callable[["Mailbox"], None]) -> list[Job]:
+        """Call `feeds` with `self` and return the jobs it would have run."""
+        saved, self._jobs = self._jobs, {}
+        try:
+            feeds(self)
+            return list(self._jobs.values())
+        finally:
+            self._jobs = saved
 
-    @staticmethod
-    def _make_stable_msgid(left, right):
-        left = sha1(left.encode()).hexdigest()[:10]
+    def run_forever(
+        self,
+        feeds: Callable[["Mailbox"], None],
+        *,
+        checkpoint: timedelta = timedelta(minutes=10),
+        interval: timedelta = timedelta(minutes=5),
+        workers: Optional[int] = None,
+    ):
+        """Keep running `feeds`, fetching each feed again when it expires.
+
+        A feed is fetched at most once every `interval`, even if it expires
+        sooner. State and the Message-ID index are kept in memory between
+        runs. Mailbox is locked only while messages are delivered and state
+        is saved every `checkpoint`.
+        """
+        jobs = self.collect(feeds)
+        workers = workers or self.workers
+
+        if self.profiler:
+            self.profiler.start()
+        self._msgid2key = None
+        self._state_dirty = False
+        self.state.load()
+        if self.seen:
+            self.seen.load()
+
+        queue = [(self._next_run(job), i, job) for i, job in enumerate(jobs)]
+        heapify(queue)
+
+        checkpoint = checkpoint.total_seconds()
+        interval = interval.total_seconds()
+        next_checkpoint = monotonic() + checkpoint
+        try:
+            while queue:
+                now = time()
+                due = []
+                while queue and queue[0][0] <= now:
+                    due.append(heappop(queue))
+
+                due_jobs = sorted(
+                    (job for _, _, job in due), key=lambda job: -job.priority
+                )
+                fetched = [*self._fetch_all(due_jobs, workers)]
+                if fetched:
+                    self._received_hdr = None
+                    self.mailbox.lock()
+                    try:
+                        for job, x in fetched:
+                            self._deliver(job, *x)
+                    finally:
+                        try:
+                            self.mailbox.flush()
+                            # Index is saved locked like in `__exit__`.
+                            if (
+                                next_checkpoint <= monotonic()
+                                and self._msgid2key is not None
+                            ):
+                                self._save_msgids()
+                        finally:
+                            self.mailbox.unlock()
+
+                not_before = time() + interval
+                for _, i, job in due:
+                    next_run = max(self._next_run(job), not_before)
+                    heappush(queue, (next_run, i, job))
+
+                if next_checkpoint <= monotonic():
+                    self._checkpoint()
+                    next_checkpoint = monotonic() + checkpoint
+
+                self.log.debug("Next feed in %s", human_duration(queue[0][0] - time()))
+                sleep(
+                    max(
+                        0,
+                        min(
+                            queue[0][0] - time(),
+                            next_checkpoint - monotonic(),
+                        ),
+                    )
+                )
+        finally:
+            self._checkpoint()
+            if self._msgid2key is not None:
+                self._save_msgids()
+            if self.profiler:
+                self.profiler.stop()
+
+    def run(self, jobs: Iterable[Job], *, workers: Optional[int] = None):
+        """Run due `jobs` fetching up to `workers` feeds in parallel.
+
+        Feeds are fetched in order of priority, then the longest expired
+        first. Feeds not started before `budget` runs out are left for the
+        next run, started ones time out when it runs out. Messages are
+        delivered from the calling thread.
+        """
+        jobs = sorted(
+            self.due(jobs), key=lambda job: (-job.priority, self._next_run(job))
+        )
+        timeout = socket.getdefaulttimeout()
+        try:
+            for job, x in self._fetch_all(
+                jobs, workers or self.workers, self._deadline
+            ):
+                self._deliver(job, *x)
+        finally:
+            socket.setdefaulttimeout(timeout)
+
+    def due(self, jobs: Iterable[Job]) -> list[Job]:
+        jobs = list(jobs)
+        due = set(self.state.columns(job.key for job in jobs).due())
+        return [job for job in jobs if job.key in due]
+
+    def _fetch_all(
+        self,
+        jobs: Iterable[Job],
+        workers: int,
+        deadline: Optional[float] = None,
+    ):
+        deferred = []
+
+        def fetch(job):
+            if deadline is not None and deadline <= monotonic():
+                deferred.append(job)
+                return None
+            return self._fetch(job)
+
+        if workers <= 1:
+            for job in jobs:
+                if x := fetch(job):
+                    yield job, x
+        else:
+            with ThreadPoolExecutor(workers) as pool:
+                futures = {pool.submit(fetch, job): job for job in jobs}
+                for future in as_completed(futures):
+                    if x := future.result():
+                        yield futures[future], x
+
+        if deferred:
+            self.log.warning("Out of time, deferred %d feeds", len(deferred))
+
+    def _next_run(self, job: Job) -> float:
+        if x := self.state.get(job.key).expires:
+            return x.timestamp()
+        return 0
+
+    @classmethod
+    def _make_stable_msgid(cls, left, right):
+        left = cls.MSGID_HASH(left.encode()).hexdigest()[:10]
         return f"<{left}@{right}>"
 
     def url(
@@ -70,87 +332,187 @@ class Mailbox:
             **kwargs,
         )
 
-    def parse(
-        self,
-        *,
-        key: str,
-        data: Callable[[], str],
-        expires: Union[timedelta, datetime] = timedelta(),
-        name: Optional[str] = None,
-        reply_to: bool = True,
-        user_agent: Optional[str] = None,
-    ):
+    def parse(self, **kwargs):
+        job = Job(**kwargs)
+        if self._jobs is not None:
+            self._jobs[job.key] = job
+        elif x := self._fetch(job):
+            self._deliver(job, *x)
+
+    def _fetch(self, job: Job):
         now = datetime.now(timezone.utc)
 
-        state = self.state.get(key)
+        state = self.state.get(job.key)
 
-        if x := state.expires:
-            expires_in = (x - now).total_seconds()
-            self.log.debug("%s: Expires in %s", key, human_duration(expires_in))
-            if 0 < expires_in:
-                return
+        if not self._is_due(state, now):
+            return None
 
         self._state_dirty = True
 
-        saved_agent = feedparser.USER_AGENT
+        host = urlparse(job.key).hostname
+        if host and (until := self.rate_limit.blocked_until(host)):
+            self.log.info("%s: Host blocked until %s", job.key, until)
+            state.expires = until
+            self.state.commit(state)
+            return None
+
         try:
-            feedparser.USER_AGENT = user_agent or saved_agent
-            result = feedparser.parse(
-                data(),
+            if host:
+                self.rate_limit.acquire(host)
+            if self._deadline is not None:
+                if (remaining := self._deadline - monotonic()) <= 0:
+                    # Ran out while waiting for the rate limit.
+                    return None
+                # feedparser takes no timeout. Applies to every socket
+                # operation, not the whole request, and parallel fetches may
+                # see a value set slightly earlier.
+                socket.setdefaulttimeout(remaining)
+            # Do not touch feedparser.USER_AGENT, jobs may run in parallel.
+            kwargs = dict(
                 etag=state.etag,
                 modified=state.modified,
+                agent=job.user_agent,
             )
-        finally:
-            feedparser.USER_AGENT = saved_agent
+            if self.fetcher:
+                result = self.fetcher(job.key, job.data, **kwargs)
+            else:
+                result = feedparser.parse(job.data(), **kwargs)
+        except Exception as e:
+            self.log.exception("%s: Fetch failed", job.key)
+            self._failed(job, state, now, e)
+            return None
+
+        status = result.get("status") or 200
+        if 400 <= status:
+            self.log.error("HTTP error %d: %s", status, job.key)
+            retry_after = self._retry_after(result, now)
+            if host and status in (429, 503):
+                self.rate_limit.block(host, retry_after or now + self.BACKOFF)
+            self._failed(job, state, now, f"HTTP error {status}", retry_after)
+            return None
+        elif isinstance(e := result.get("bozo_exception"), OSError):
+            self.log.error("%s: %s", job.key, e)
+            self._failed(job, state, now, e)
+            return None
+
+        return state, now, result
+
+    def _retry_after(self, result, now: datetime) -> Optional[datetime]:
+        if x := result.headers.get("retry-after"):
+            if x.isdigit():
+                return now + timedelta(seconds=int(x))
+            try:
+                return parsedate_to_datetime(x)
+            except (TypeError, ValueError) as e:
+                self.log.warn(e)
+        return None
+
+    def _expires(self, job: Job, now: datetime) -> datetime:
+        if isinstance(job.expires, timedelta):
+            return now + job.expires
+        return job.expires
+
+    def _failed(
+        self,
+        job: Job,
+        state,
+        now: datetime,
+        error,
+        not_before: Optional[datetime] = None,
+    ):
+        state.failures += 1
+        state.error = " ".join(str(error).split())
+        backoff = min(
+            self.BACKOFF * 2 ** min(state.failures - 1, 16),
+            self.MAX_BACKOFF,
+        )
+        state.expires = max(self._expires(job, now), now + backoff, not_before or now)
+        self.log.info(
+            "%s: Failed %d times, retry in %s",
+            job.key,
+            state.failures,
+            human_duration((state.expires - now).total_seconds()),
+        )
+        self.state.commit(state)
+
+    def _is_due(self, state, now: datetime) -> bool:
+        if x := state.expires:
+            expires_in = (x - now).total_seconds()
+            if self.log.isEnabledFor(logging.DEBUG):
+                self.log.debug(
+                    "%s: Expires in %s", state.key, human_duration(expires_in)
+                )
+            if 0 < expires_in:
+                return False
+        return True
+
+    def _deliver(self, job: Job, state, now: datetime, result):
+        try:
+            self._deliver_entries(job, state, result)
+        except Exception as e:
+            self.log.exception("%s: Delivery failed", job.key)
+            self._failed(job, state, now, e)
+            return
+
+        state.failures = 0
+        state.error = None
+        state.etag = result.get("etag")
 
-        if 400 <= (result.get("status") or 200):
-            self.log.error("HTTP error %d: %s", result.status, key)
+        ttl = timedelta(seconds=int(result.feed.get("ttl") or 0))
 
+        state.expires = max(self._expires(job, now), now + ttl)
+
+        if x := result.headers.get("expires"):
+            try:
+                state.expires = max(state.expires, parsedate_to_datetime(x))
+            except ValueError as e:
+                self.log.warn(e)
+
+        # Messages must be written before the state referring to them.
+        self.mailbox.flush()
+        self.state.commit(state)
+
+    def _deliver_entries(self, job: Job, state, result):
         feed = result.feed
         # Ensure we have some data (not a conditional GET).
         if result.entries:
-            self._feed_host = urlparse(feed.link).hostname
-            self._feed_msgid = self._make_stable_msgid(
-                feed.get("id") or feed.link,
-                self._feed_host,
-            )
-            self._from_hdr = formataddr(
-                (name or feed.title, "feed@%s" % self._feed_host)
-            )
-
-            self._old_modified = state.modified
-            self._modified = self._old_modified
+            self._prepare_feed(job, state, feed)
 
             has_new = False
             for entry in result.entries:
-                if msg := self._generate_entry_msg(entry, feed):
+                if msg := self._generate_entry_msg(entry, feed, job):
                     has_new = True
-                    self._add_msg(msg)
+                    self._add_msg(msg, job.key, entry)
 
-            if has_new and reply_to:
+            if has_new and job.reply_to:
                 msg = self._generate_feed_msg(feed)
                 self._add_msg(msg)
 
             if self._modified is not None:
                 state.modified = self._modified
 
-        state.etag = result.get("etag")
-
-        if isinstance(expires, timedelta):
-            expires = now + expires
-
-        ttl = timedelta(seconds=int(feed.get("ttl") or 0))
+    def _prepare_feed(self, job: Job, state, feed):
+        self._feed_host = urlparse(feed.link).hostname
+        self._feed_msgid = self._make_stable_msgid(
+            feed.get("id") or feed.link,
+            self._feed_host,
+        )
+        self._from_hdr = _header(
+            "From",
+            formataddr((job.name or feed.title, "feed@%s" % self._feed_host)),
+        )
+        self._in_reply_to_hdr = _header("In-Reply-To", self._feed_msgid)
+        if self._received_hdr is None:
+            self._received_hdr = _header(
+                "Received",
+                "mrss; %s" % formatdate(localtime=True),
+            )
 
-        state.expires = max(expires, now + ttl)
-
-        if x := result.headers.get("expires"):
-            try:
-                state.expires = max(state.expires, parsedate_to_datetime(x))
-            except ValueError as e:
-                self.log.warn(e)
+        self._old_modified = state.modified
+        self._modified = self._old_modified
 
     def _generate_feed_msg(self, feed):
-        msg = EmailMessage()
+        msg = EmailMessage(policy=_POLICY)
         msg["From"] = self._from_hdr
         msg["Message-ID"] = self._feed_msgid
         msg["Subject"] = feed.title
@@ -163,7 +525,7 @@ class Mailbox:
             )
         return msg
 
-    def _generate_entry_msg(self, entry, feed):
+    def _generate_entry_msg(self, entry, feed, job: Job):
         date_as_tv = mktime(
             entry.get("updated_parsed") or entry.get("published_parsed")
         )
@@ -174,9 +536,9 @@ class Mailbox:
 
         self._modified = max(self._modified or date, date)
 
-        msg = EmailMessage()
-        msg["Received"] = "mrss; %s" % formatdate(localtime=True)
-        msg["In-Reply-To"] = self._feed_msgid
+        msg = EmailMessage(policy=_POLICY)
+        msg["Received"] = self._received_hdr
+        msg["In-Reply-To"] = self._in_reply_to_hdr
         left = entry.get("id") or entry.get("link") or entry.title
         assert 5 < len(left)
         msg["Message-ID"] = self._make_stable_msgid(left, self._feed_host)
@@ -204,11 +566,18 @@ class Mailbox:
         msg["Content-Language"] = content["language"] or feed.get("language")
         for tag in entry.get("tags") or []:
             msg["X-Category"] = tag.label or tag.term
-        msg.set_content(
-            content["value"],
-            subtype=content["type"].split("/")[1],
-            cte="8bit",
-        )
+        value = content["value"]
+        subtype = content["type"].split("/")[1]
+        if job.max_size is not None:
+            value, subtype = trim_content(value, subtype, job.max_size, entry.link)
+        if job.summary and subtype == "html":
+            summary = html_to_text(value)
+            if job.max_size is not None:
+                summary = truncate(summary, job.max_size, entry.link)
+            msg.set_content(summary, cte="8bit")
+            msg.add_alternative(value, subtype=subtype, cte="8bit")
+        else:
+            msg.set_content(value, subtype=subtype, cte="8bit")
         return msg
 
     def _update_msgids(self):
@@ -216,10 +585,17 @@ class Mailbox:
         for key, msg in self.mailbox.iteritems():
             self._msgid2key[msg["Message-ID"]] = key
 
-    def _add_msg(self, msg):
+    def _save_msgids(self):
+        pass
+
+    def _add_msg(self, msg, source=None, entry=None):
         if self._msgid2key is None:
             self._update_msgids()
         msgid = msg["Message-ID"]
         if msgid not in self._msgid2key:
+            if self.seen and entry:
+                if self.seen.add(source, entry_fingerprints(entry)):
+                    self.log.debug("Duplicate: %s", msgid)
+                    return
             self.log.debug("New: %s", msgid)
             self._msgid2key[msgid] = self.mailbox.add(msg)
@@ -1,11 +1,23 @@
 from ._mailbox import Mailbox
+from email.parser import BytesHeaderParser
 from pathlib import Path
+from time import time_ns
+from typing import Optional
+import gzip
 import mailbox
 import os
+import tempfile
 
 
 class Maildir(Mailbox):
-    def __init__(self, *, path: Path, create: bool = True, **kwargs):
+    def __init__(
+        self,
+        *,
+        path: Path,
+        create: bool = True,
+        index: Optional[str] = "msgids.gz",
+        **kwargs,
+    ):
         if create:
             # Maildir([create=True]) creates subdirs only if path does not exist.
             for subdir in ["cur", "new", "tmp"]:
@@ -19,3 +31,101 @@ class Maildir(Mailbox):
             mailbox=mailbox.Maildir(path, create=create),
             **kwargs,
         )
+        self.index = index and os.path.join(path, index)
+        self._subdirs = [os.path.join(path, subdir) for subdir in ["cur", "new"]]
+
+    def _stat_subdirs(self):
+        now = time_ns()
+        mtimes = []
+        for dirname in self._subdirs:
+            mtime = os.stat(dirname).st_mtime_ns
+            # Directory may change again within its timestamp granularity
+            # without changing mtime, so do not trust very recent ones.
+            mtimes.append(mtime if mtime < now - 1_000_000_000 else 0)
+        return mtimes
+
+    def _load_index(self):
+        key2msgid = {}
+        try:
+            with gzip.open(self.index, mode="rt", newline="\n") as f:
+                mtimes = [int(x) for x in next(f).split()]
+                for line in f:
+                    key, msgid = line.rstrip("\n").split("\t")
+                    key2msgid[key] = msgid
+        except (FileNotFoundError, StopIteration):
+            mtimes = None
+        except (OSError, EOFError, ValueError) as e:
+            # Only a cache, scan everything again.
+            self.log.warning("%s: Ignoring corrupt index: %s", self.index, e)
+            mtimes, key2msgid = None, {}
+        return mtimes, key2msgid
+
+    @staticmethod
+    def _read_msgid(path: str) -> Optional[str]:
+        # Read header only.
+        lines = []
+        with open(path, "rb") as f:
+            for line in f:
+                if line in (b"\n", b"\r\n"):
+                    break
+                lines.append(line)
+        return BytesHeaderParser().parsebytes(b"".join(lines))["Message-ID"]
+
+    def _update_msgids(self):
+        if not self.index:
+            return super()._update_msgids()
+
+        # Stat before listing so later changes are noticed next time.
+        mtimes = self._stat_subdirs()
+        old_mtimes, key2msgid = self._load_index()
+
+        if mtimes != old_mtimes or 0 in mtimes:
+            self.log.debug("Scanning for new messages")
+
+            old_key2msgid, key2msgid = key2msgid, {}
+            for dirname in self._subdirs:
+                for name in os.listdir(dirname):
+                    if name.startswith("."):
+                        continue
+                    key = name.split(self.mailbox.colon)[0]
+                    if (msgid := old_key2msgid.get(key)) is None:
+                        try:
+                            msgid = self._read_msgid(os.path.join(dirname, name))
+                        except FileNotFoundError:
+                            # Moved by someone else; mtime changed already.
+                            continue
+                    key2msgid[key] = msgid
+
+        self._index_mtimes = mtimes
+        self._index_dirty = mtimes != old_mtimes
+        self._msgid2key = {msgid: key for key, msgid in key2msgid.items()}
+        self._index_size = len(self._msgid2key)
+
+    def _save_msgids(self):
+        if not self.index:
+            return
+
+        if not self._index_dirty and self._index_size == len(self._msgid2key):
+            return
+
+        # Maildir locks are no-op, another process may be saving too.
+        fd, tmp = tempfile.mkstemp(
+            prefix=os.path.basename(self.index) + ".",
+            dir=os.path.dirname(self.index),
+        )
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.open(
+                raw, mode="wt", newline="\n"
+            ) as f:
+                f.write("%d %d\n" % tuple(self._index_mtimes))
+                for msgid, key in self._msgid2key.items():
+                    # Generated Message-IDs never look like these.
+                    if msgid is not None and not any(c in msgid for c in "\t\r\n"):
+                        f.write(f"{key}\t{msgid}\n")
+            os.rename(tmp, self.index)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+        self._index_dirty = False
+        self._index_size = len(self._msgid2key)
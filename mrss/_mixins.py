@@ -1,6 +1,8 @@
 from ._maildir import Maildir
+from ._seen import SeenSet
 from ._state import GzipState
 from datetime import timedelta
+from typing import Optional
 import os.path
 
 
@@ -10,11 +12,13 @@ class SitesMixin:
         channel: str,
         *,
         expires=timedelta(hours=12),
+        priority=0,
         **kwargs,
     ):
         return self.url(
             url=f"https://www.youtube.com/feeds/videos.xml?channel_id={channel}",
             expires=expires,
+            priority=priority,
             **kwargs,
         )
 
@@ -26,6 +30,7 @@ class SitesMixin:
         name: str = None,
         expires=timedelta(3),
         reply_to=False,
+        priority=-1,
         **kwargs,
     ):
         return self.url(
@@ -33,6 +38,7 @@ class SitesMixin:
             url=f"https://gitlab.com/{repo}/commits/{branch}?format=atom",
             expires=expires,
             reply_to=reply_to,
+            priority=priority,
             **kwargs,
         )
 
@@ -44,6 +50,7 @@ class SitesMixin:
         name: str = None,
         expires=timedelta(3),
         reply_to=False,
+        priority=-1,
         **kwargs,
     ):
         return self.url(
@@ -51,6 +58,7 @@ class SitesMixin:
             url=f"https://github.com/{repo}/commits/{branch}.atom",
             expires=expires,
             reply_to=reply_to,
+            priority=priority,
             **kwargs,
         )
 
@@ -61,6 +69,7 @@ class SitesMixin:
         name: str = None,
         expires=timedelta(7),
         reply_to=False,
+        priority=1,
         **kwargs,
     ):
         return self.url(
@@ -68,6 +77,7 @@ class SitesMixin:
             url=f"https://github.com/{repo}/releases.atom",
             expires=expires,
             reply_to=reply_to,
+            priority=priority,
             **kwargs,
         )
 
@@ -78,6 +88,7 @@ class SitesMixin:
         name: str = None,
         expires=timedelta(hours=12),
         reply_to=False,
+        priority=0,
         **kwargs,
     ):
         return self.url(
@@ -85,6 +96,7 @@ class SitesMixin:
             url=f"https://www.reddit.com/user/{user}/submitted.rss",
             expires=expires,
             reply_to=reply_to,
+            priority=priority,
             **kwargs,
         )
 
@@ -94,12 +106,14 @@ class SitesMixin:
         *,
         expires=timedelta(7),
         reply_to=False,
+        priority=1,
         **kwargs,
     ):
         return self.url(
             url,
             expires=expires,
             reply_to=reply_to,
+            priority=priority,
             **kwargs,
         )
 
@@ -116,11 +130,22 @@ class UserAgentMixin:
 
 
 class EasyMaildir(SitesMixin, UserAgentMixin, Maildir):
-    def __init__(self, tilde_path: str, /, *, statefile: str = "state.gz"):
+    def __init__(
+        self,
+        tilde_path: str,
+        /,
+        *,
+        statefile: str = "state.gz",
+        seenfile: Optional[str] = None,
+        **kwargs,
+    ):
         path = os.path.expanduser(tilde_path)
+        if seenfile:
+            kwargs["seen"] = SeenSet(os.path.normpath(os.path.join(path, seenfile)))
         super().__init__(
             path=path,
             state=GzipState(
                 filename=os.path.normpath(os.path.join(path, statefile)),
             ),
+            **kwargs,
         )
@@ -0,0 +1,120 @@
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from threading import current_thread
+from time import perf_counter, strftime
+import cProfile
+import io
+import os
+import pstats
+import tracemalloc
+
+
+class Profiler:
+    """Profile a run with cProfile and tracemalloc.
+
+    On `stop()` writes `mrss-<time>.pstats` and a `mrss-<time>.txt` report of
+    the `top` slowest feeds and allocation sites into `path`. Only work done
+    in the thread that called `start()` is profiled.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        cpu: bool = True,
+        memory: bool = True,
+        top: int = 20,
+    ):
+        self.path = path
+        self.cpu = cpu
+        self.memory = memory
+        self.top = top
+
+    def start(self):
+        self._thread = current_thread()
+        self._name = strftime("mrss-%Y%m%d-%H%M%S")
+        # key -> [profile, seconds, allocated bytes, peak bytes]
+        self._feeds = {}
+        self._profile = cProfile.Profile() if self.cpu else None
+        if self.memory:
+            tracemalloc.start()
+        if self._profile:
+            self._profile.enable()
+
+    @contextmanager
+    def feed(self, key: str):
+        """Attribute work done inside to feed `key`."""
+        if current_thread() is not self._thread:
+            yield
+            return
+
+        if self._profile:
+            self._profile.disable()
+        x = self._feeds.setdefault(key, [None, 0.0, 0, 0])
+        if self.cpu:
+            x[0] = x[0] or cProfile.Profile()
+            x[0].enable()
+        if self.memory:
+            tracemalloc.reset_peak()
+            start_size, _ = tracemalloc.get_traced_memory()
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            x[1] += perf_counter() - start
+            if self.memory:
+                size, peak = tracemalloc.get_traced_memory()
+                x[2] += size - start_size
+                x[3] = max(x[3], peak - start_size)
+            if self.cpu:
+                x[0].disable()
+            if self._profile:
+                self._profile.enable()
+
+    def wrap(self, fn):
+        """Wrap `fn(job, ...)` to run inside `feed(job.key)`."""
+
+        @wraps(fn)
+        def wrapper(job, *args, **kwargs):
+            with self.feed(job.key):
+                return fn(job, *args, **kwargs)
+
+        return wrapper
+
+    def stop(self):
+        snapshot = None
+        if self.memory:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+        if self._profile:
+            self._profile.disable()
+
+        os.makedirs(self.path, exist_ok=True)
+        basename = os.path.join(self.path, self._name)
+
+        report = io.StringIO()
+        feeds = sorted(self._feeds.items(), key=lambda x: x[1][1], reverse=True)
+
+        print(f"{'Seconds':>10} {'Allocated':>12} {'Peak':>12}  Feed", file=report)
+        for key, (_, secs, size, peak) in feeds[: self.top]:
+            print(f"{secs:10.3f} {size:12d} {peak:12d}  {key}", file=report)
+
+        if self.cpu:
+            stats = pstats.Stats(self._profile, stream=report)
+            for key, (profile, *_) in feeds:
+                stats.add(profile)
+            stats.dump_stats(basename + ".pstats")
+
+            for key, (profile, *_) in feeds[: self.top]:
+                print(f"\n{key}:", file=report)
+                feed_stats = pstats.Stats(profile, stream=report)
+                feed_stats.sort_stats("cumulative").print_stats(5)
+
+        if snapshot:
+            print(f"\nTop {self.top} allocations:", file=report)
+            for stat in snapshot.statistics("lineno")[: self.top]:
+                print(stat, file=report)
+
+        with open(basename + ".txt", "w") as f:
+            f.write(report.getvalue())
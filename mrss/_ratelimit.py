@@ -0,0 +1,47 @@
+from datetime import datetime, timezone
+from threading import Lock
+from time import monotonic, sleep
+from typing import Optional
+
+
+class RateLimiter:
+    """Per-host token bucket.
+
+    `rate` is the number of requests per second allowed for a host, `None`
+    means unlimited. Hosts can be blocked until a given time, for example
+    when they answer with 429 Too Many Requests.
+    """
+
+    def __init__(self, rate: Optional[float] = None, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._lock = Lock()
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._blocked: dict[str, datetime] = {}
+
+    def acquire(self, host: str):
+        """Wait until a request can be made to `host`."""
+        if self.rate is None:
+            return
+
+        with self._lock:
+            now = monotonic()
+            tokens, last = self._buckets.get(host, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate) - 1
+            self._buckets[host] = (tokens, now)
+
+        # Token is reserved, so waiting can happen outside the lock.
+        if tokens < 0:
+            sleep(-tokens / self.rate)
+
+    def block(self, host: str, until: datetime):
+        with self._lock:
+            self._blocked[host] = max(until, self._blocked.get(host, until))
+
+    def blocked_until(self, host: str) -> Optional[datetime]:
+        with self._lock:
+            if until := self._blocked.get(host):
+                if datetime.now(timezone.utc) < until:
+                    return until
+                del self._blocked[host]
+        return None
@@ -0,0 +1,185 @@
+from datetime import datetime
+from email.utils import format_datetime
+from hashlib import sha1
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Thread
+from time import sleep
+from typing import Callable, Optional, Union
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+from urllib.request import Request, url2pathname, urlopen
+import feedparser
+import json
+import os
+
+
+class Archive:
+    """Directory of recorded responses."""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def _filename(self, key: str, ext: str):
+        return os.path.join(self.path, sha1(key.encode()).hexdigest() + ext)
+
+    def put(self, key: str, status: int, headers: dict[str, str], body: bytes):
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._filename(key, ".body"), "wb") as f:
+            f.write(body)
+        with open(self._filename(key, ".json"), "w") as f:
+            json.dump(dict(key=key, status=status, headers=headers), f)
+
+    def get(self, key: str) -> tuple[int, dict[str, str], bytes]:
+        with open(self._filename(key, ".json")) as f:
+            meta = json.load(f)
+        with open(self._filename(key, ".body"), "rb") as f:
+            body = f.read()
+        return meta["status"], meta["headers"], body
+
+    def __contains__(self, key: str):
+        return os.path.exists(self._filename(key, ".json"))
+
+
+class Recorder:
+    """Fetcher that saves every response to `archive`."""
+
+    def __init__(self, archive: Archive):
+        self.archive = archive
+
+    def __call__(
+        self,
+        key: str,
+        data: Callable[[], Union[str, bytes]],
+        *,
+        etag: Optional[str] = None,
+        modified: Optional[datetime] = None,
+        agent: Optional[str] = None,
+    ):
+        source = data()
+        if isinstance(source, str) and urlsplit(source).scheme in ("http", "https"):
+            status, headers, body = self._get(source, etag, modified, agent)
+        else:
+            status, headers, body = 200, {}, self._read(source)
+
+        self.archive.put(key, status, headers, body)
+
+        headers = {k.lower(): v for k, v in headers.items()}
+        if body:
+            result = feedparser.parse(body, response_headers=headers)
+        else:
+            result = feedparser.parse(b"")
+        result["status"] = status
+        result["headers"] = headers
+        if etag := headers.get("etag"):
+            result["etag"] = etag
+        return result
+
+    @staticmethod
+    def _read(source: Union[str, bytes]) -> bytes:
+        # Like feedparser, accept a file name or file: URL besides the document.
+        if isinstance(source, bytes):
+            return source
+        url = urlsplit(source)
+        if url.scheme == "file":
+            source = url2pathname(url.path)
+        elif not os.path.exists(source):
+            return source.encode()
+        with open(source, "rb") as f:
+            return f.read()
+
+    @staticmethod
+    def _get(url: str, etag, modified, agent):
+        request = Request(url, headers={"User-Agent": agent or feedparser.USER_AGENT})
+        if etag:
+            request.add_header("If-None-Match", etag)
+        if modified:
+            request.add_header("If-Modified-Since", format_datetime(modified, True))
+        try:
+            with urlopen(request) as response:
+                return response.status, dict(response.headers), response.read()
+        except HTTPError as e:
+            return e.code, dict(e.headers), e.read()
+
+
+class ReplayServer:
+    """Fetcher that serves responses of `archive` from a local HTTP server.
+
+    Every response is delayed by `latency` seconds and sent at most
+    `bandwidth` bytes per second.
+    """
+
+    CHUNK_SIZE = 16 * 1024
+
+    # Set by the server, not meaningful for the replayed body.
+    _SKIP_HEADERS = {
+        "connection",
+        "content-encoding",
+        "content-length",
+        "date",
+        "server",
+        "transfer-encoding",
+    }
+
+    def __init__(
+        self,
+        archive: Archive,
+        *,
+        latency: float = 0.0,
+        bandwidth: Optional[float] = None,
+    ):
+        self.archive = archive
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self._server = None
+
+    def __enter__(self):
+        replay = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                try:
+                    key = bytes.fromhex(self.path[1:]).decode()
+                except ValueError:
+                    key = None
+                if key is None or key not in replay.archive:
+                    self.send_error(404)
+                    return
+
+                status, headers, body = replay.archive.get(key)
+                sleep(replay.latency)
+
+                self.send_response(status)
+                for name, value in headers.items():
+                    if name.lower() not in replay._SKIP_HEADERS:
+                        self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+
+                for i in range(0, len(body), replay.CHUNK_SIZE):
+                    chunk = body[i : i + replay.CHUNK_SIZE]
+                    self.wfile.write(chunk)
+                    if replay.bandwidth:
+                        sleep(len(chunk) / replay.bandwidth)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb, /):
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/"
+
+    def __call__(self, key: str, data, **kwargs):
+        if key not in self.archive:
+            raise KeyError(f"Not recorded: {key}")
+        return feedparser.parse(self.url + key.encode().hex(), **kwargs)
@@ -0,0 +1,127 @@
+from array import array
+from datetime import timedelta
+from hashlib import blake2b
+from pathlib import Path
+from time import time
+from typing import Iterable, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit
+import gzip
+import os
+import re
+
+# Query parameters that only track where the link was clicked.
+_TRACKING_PARAMS = re.compile(r"utm_.*|fbclid|gclid")
+
+
+def _hash(s: str) -> int:
+    return int.from_bytes(
+        blake2b(s.encode(), digest_size=8).digest(),
+        "little",
+        signed=True,
+    )
+
+
+def normalize_link(link: str) -> str:
+    url = urlsplit(link.strip())
+    host = (url.hostname or "").removeprefix("www.")
+    path = url.path.rstrip("/")
+    query = urlencode(
+        sorted(
+            (k, v)
+            for k, v in parse_qsl(url.query, keep_blank_values=True)
+            if not _TRACKING_PARAMS.fullmatch(k)
+        )
+    )
+    fragment = f"#{url.fragment}" if url.fragment else ""
+    return f"{host}{path}?{query}{fragment}"
+
+
+def entry_fingerprints(entry) -> list[int]:
+    """Return fingerprints identifying an entry independently of its feed."""
+    # Not title: unrelated feeds often have entries titled "v1.0.0" or
+    # "Weekly update" on the same day.
+    if link := entry.get("link"):
+        return [_hash("link:" + normalize_link(link))]
+    return []
+
+
+class SeenSet:
+    """Bounded set of entry fingerprints.
+
+    Fingerprints not seen for `max_age` are forgotten and only the `capacity`
+    most recently seen ones are kept.
+    """
+
+    def __init__(
+        self,
+        filename: Optional[Path] = None,
+        *,
+        capacity: int = 100_000,
+        max_age: timedelta = timedelta(days=90),
+    ):
+        self.filename = filename
+        self.capacity = capacity
+        self.max_age = max_age
+        self.store: dict[int, tuple[int, int]] = {}
+        self.dirty = False
+
+    def load(self):
+        self.store = {}
+        self.dirty = False
+        if not self.filename:
+            return
+
+        a = array("q")
+        try:
+            with gzip.open(self.filename, mode="rb") as f:
+                a.frombytes(f.read())
+        except FileNotFoundError:
+            return
+
+        # Saved oldest first so insertion order is kept.
+        it = iter(a)
+        for fp, source, seen in zip(it, it, it):
+            self.store[fp] = (source, seen)
+        self._trim()
+
+    def save(self):
+        if not self.filename or not self.dirty:
+            return
+
+        self._trim()
+        a = array("q")
+        for fp, (source, seen) in self.store.items():
+            a.extend((fp, source, seen))
+
+        tmp = self.filename + "~"
+        with gzip.open(tmp, mode="wb") as f:
+            f.write(a.tobytes())
+        os.rename(tmp, self.filename)
+        self.dirty = False
+
+    def _trim(self):
+        oldest = time() - self.max_age.total_seconds()
+        while self.store:
+            fp = next(iter(self.store))
+            if len(self.store) <= self.capacity and oldest <= self.store[fp][1]:
+                break
+            del self.store[fp]
+
+    def add(self, source: str, fingerprints: Iterable[int]) -> bool:
+        """Record `fingerprints` and return whether any of them was seen
+        coming from a source other than `source`."""
+        source = _hash(source)
+        now = int(time())
+        duplicate = False
+        for fp in fingerprints:
+            if (x := self.store.pop(fp, None)) and x[0] != source:
+                duplicate = True
+                # Keep attributed to the source that was delivered.
+                source_fp = x[0]
+            else:
+                source_fp = source
+            self.store[fp] = (source_fp, now)
+        self.dirty = True
+        if len(self.store) > self.capacity:
+            self._trim()
+        return duplicate
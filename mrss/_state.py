@@ -1,13 +1,23 @@
 from abc import ABC, abstractmethod
+from array import array
+from collections import Counter
 from dataclasses import dataclass, fields
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from email.utils import parsedate_to_datetime, format_datetime
+from functools import cached_property
+from itertools import compress
 from operator import attrgetter
 from pathlib import Path
-from typing import Optional
+from threading import Lock
+from time import time
+from typing import Iterable, Optional
+from urllib.parse import urlsplit
 import csv
 import gzip
+import io
+import math
 import os
+import sys
 
 
 @dataclass(slots=True, kw_only=True)
@@ -16,9 +26,20 @@ class StateItem:
     modified: Optional[str] = None
     expires: Optional[str] = None
     etag: Optional[str] = None
+    failures: int = 0
+    error: Optional[str] = None
 
     @classmethod
-    def from_csv(cls, key: str, modified: str, expires: str, etag: str):
+    def from_csv(
+        cls,
+        key: str,
+        modified: str,
+        expires: str,
+        etag: str,
+        # Missing from older files.
+        failures: str = "",
+        error: str = "",
+    ):
         def parse_date(s: str) -> Optional[datetime]:
             if s:
                 return parsedate_to_datetime(s)
@@ -29,6 +50,8 @@ class StateItem:
             modified=parse_date(modified),
             expires=parse_date(expires),
             etag=etag or None,
+            failures=int(failures or 0),
+            error=error or None,
         )
 
     def to_csv(self):
@@ -42,9 +65,100 @@ class StateItem:
             modified=format_date(self.modified),
             expires=format_date(self.expires),
             etag=self.etag,
+            failures=self.failures or None,
+            error=self.error,
         )
 
 
+class StateColumns:
+    """Column-wise snapshot of state items for bulk queries.
+
+    Dates are stored as epoch seconds, NaN if unset. Columns are built on
+    first use, so they may or may not see later changes to the items.
+    """
+
+    def __init__(self, items: Iterable[StateItem]):
+        self._items = list(items)
+        self.keys: list[str] = [item.key for item in self._items]
+
+    @staticmethod
+    def _epochs(dts: Iterable[Optional[datetime]]) -> array:
+        return array("d", (dt.timestamp() if dt else math.nan for dt in dts))
+
+    @cached_property
+    def expires(self) -> array:
+        return self._epochs(item.expires for item in self._items)
+
+    @cached_property
+    def modified(self) -> array:
+        return self._epochs(item.modified for item in self._items)
+
+    @cached_property
+    def failures(self) -> array:
+        return array("l", (item.failures for item in self._items))
+
+    @cached_property
+    def hosts(self) -> list[str]:
+        hosts = {}
+        result = []
+        for key in self.keys:
+            url = urlsplit(key)
+            host = url.hostname or url.scheme
+            if (x := hosts.get(host)) is None:
+                x = hosts[host] = sys.intern(host)
+            result.append(x)
+        return result
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _due_mask(self, within: timedelta, now: Optional[float]):
+        until = (time() if now is None else now) + within.total_seconds()
+        if "expires" not in self.__dict__:
+            # Cheaper than converting every date when the column is not
+            # needed otherwise.
+            until = datetime.fromtimestamp(until, timezone.utc)
+            return (not (x.expires and x.expires > until) for x in self._items)
+        # NaN (never fetched) compares false, so it is due.
+        return (not x > until for x in self.expires)
+
+    def due(
+        self,
+        within: timedelta = timedelta(),
+        *,
+        now: Optional[float] = None,
+    ) -> list[str]:
+        """Return keys expiring in `within`."""
+        return list(compress(self.keys, self._due_mask(within, now)))
+
+    def count_due(
+        self,
+        within: timedelta = timedelta(),
+        *,
+        now: Optional[float] = None,
+    ) -> int:
+        return sum(self._due_mask(within, now))
+
+    def host_counts(
+        self,
+        within: Optional[timedelta] = None,
+        *,
+        now: Optional[float] = None,
+    ) -> Counter:
+        """Count feeds per host, only those expiring in `within` if given."""
+        if within is None:
+            return Counter(self.hosts)
+        return Counter(compress(self.hosts, self._due_mask(within, now)))
+
+    def modified_ages(self, *, now: Optional[float] = None) -> array:
+        """Return seconds since last modification of feeds that have one."""
+        now = time() if now is None else now
+        return array("d", (now - x for x in self.modified if not math.isnan(x)))
+
+    def failing(self) -> list[str]:
+        return [key for key, x in zip(self.keys, self.failures) if x]
+
+
 class State(ABC):
     @abstractmethod
     def load(self):
@@ -58,6 +172,13 @@ class State(ABC):
     def get(self):
         pass  # pragma: no cover
 
+    def columns(self, keys: Iterable[str]) -> StateColumns:
+        """Return columns of `keys`."""
+        return StateColumns(map(self.get, keys))
+
+    def commit(self, item: StateItem):
+        """Persist changes of `item` before the next `save()`."""
+
 
 class DictState(State):
     def load(self):
@@ -73,6 +194,12 @@ class DictState(State):
     def save(self):
         pass
 
+    def columns(self, keys: Optional[Iterable[str]] = None) -> StateColumns:
+        """Return columns of `keys` or all items."""
+        if keys is None:
+            return StateColumns(self.store.values())
+        return super().columns(keys)
+
 
 class GzipState(DictState):
     _FIELD_NAMES = [f.name for f in fields(StateItem)]
@@ -88,6 +215,10 @@ class GzipState(DictState):
     def __init__(self, filename: Path):
         super().__init__()
         self.filename = filename
+        # Write-ahead log of committed items, merged into `filename` on save.
+        self.log_filename = filename + ".log"
+        self._log = None
+        self._log_lock = Lock()
 
     def load(self):
         super().load()
@@ -101,6 +232,61 @@ class GzipState(DictState):
         except FileNotFoundError:
             pass
 
+        self._close_log()
+        try:
+            with open(self.log_filename, newline="") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+
+        # Last record may be incomplete after a crash.
+        stream = io.StringIO(data[: data.rfind("\n") + 1])
+        reader = csv.DictReader(stream, dialect=self.TSVDialect)
+        end = 0
+        try:
+            for row in reader:
+                # Missing fields are None, extra ones are listed under None.
+                if None in row or None in row.values():
+                    break
+                try:
+                    item = StateItem.from_csv(**row)
+                except (TypeError, ValueError):
+                    break
+                self.store[item.key] = item
+                end = stream.tell()
+        except csv.Error:
+            pass
+
+        if end < len(data):
+            # Otherwise next commit would be appended to the broken record.
+            tmp = self.log_filename + "~"
+            with open(tmp, mode="w", newline="") as f:
+                f.write(data[:end])
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(tmp, self.log_filename)
+
+    def _close_log(self):
+        with self._log_lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+    def commit(self, item: StateItem):
+        with self._log_lock:
+            if self._log is None:
+                self._log = open(self.log_filename, mode="a", newline="")
+                self._log_writer = csv.DictWriter(
+                    self._log,
+                    fieldnames=self._FIELD_NAMES,
+                    dialect=self.TSVDialect,
+                )
+                if self._log.tell() == 0:
+                    self._log_writer.writeheader()
+            self._log_writer.writerow(item.to_csv())
+            self._log.flush()
+            os.fsync(self._log.fileno())
+
     def save(self):
         tmp = self.filename + "~"
         with gzip.open(tmp, mode="wt", newline="") as f:
@@ -117,4 +303,11 @@ class GzipState(DictState):
             ):
                 writer.writerow(item.to_csv())
         os.rename(tmp, self.filename)
+
+        self._close_log()
+        try:
+            os.remove(self.log_filename)
+        except FileNotFoundError:
+            pass
+
         super().save()
@@ -17,3 +17,20 @@ def human_duration(secs: float, /):
         return "<1s"
     else:
         return "0s"
+
+
+def parse_duration(s: str, /):
+    """Inverse of `human_duration`."""
+    units = dict(w=60 * 60 * 24 * 7, d=60 * 60 * 24, h=60 * 60, m=60, s=1)
+
+    parts = s.split()
+    if not parts:
+        raise ValueError(f"Invalid duration: {s!r}")
+
+    secs = 0
+    for part in parts:
+        value, unit = part[:-1], part[-1:]
+        if unit not in units or not value.isdigit():
+            raise ValueError(f"Invalid duration: {s!r}")
+        secs += int(value) * units[unit]
+    return secs
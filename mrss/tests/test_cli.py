@@ -0,0 +1,95 @@
+from mrss._cli import *
+from mrss.tests.test_mailbox import feed_data
+import pytest
+
+
+@pytest.fixture
+def config(tmp_path):
+    feed = tmp_path / "feed.xml"
+    feed.write_bytes(feed_data(1))
+
+    config = tmp_path / "feeds.toml"
+    config.write_text(f"""
+maildir = "{tmp_path / "mail"}"
+
+[[feeds]]
+shell = "cat {feed}"
+key = "feed"
+expires = "1d"
+""")
+    return str(config)
+
+
+def test_run_delivers_messages(config, tmp_path):
+    assert main(["-c", config, "-j", "2"]) == 0
+
+    assert len(os.listdir(tmp_path / "mail" / "new")) == 2
+
+
+def test_dry_run_does_not_fetch(config, tmp_path, capsys):
+    assert main(["-c", config, "--dry-run"]) == 0
+
+    assert capsys.readouterr().out == "x-mrss:feed\n"
+    assert not os.listdir(tmp_path / "mail" / "new")
+
+
+def test_only_due_exits_early(config, tmp_path, capsys):
+    main(["-c", config])
+    state = tmp_path / "mail" / "state.gz"
+    mtime = state.stat().st_mtime_ns
+
+    assert main(["-c", config, "--only-due"]) == 0
+    assert main(["-c", config, "--dry-run"]) == 0
+
+    assert capsys.readouterr().out == ""
+    assert state.stat().st_mtime_ns == mtime
+
+
+@pytest.mark.parametrize(
+    "spec, expected",
+    [
+        (dict(url="u"), ("url", ("u",), {})),
+        (dict(shell="c", key="k"), ("shell", (), dict(cmd="c", key="k"))),
+        (
+            dict(youtube="c", expires=60),
+            ("youtube", ("c",), dict(expires=timedelta(minutes=1))),
+        ),
+        (
+            dict(github_commits="r", branch="b", expires="1d"),
+            ("github_commits", ("r",), dict(branch="b", expires=timedelta(1))),
+        ),
+    ],
+)
+def test_add_feed(spec, expected):
+    from unittest.mock import Mock
+
+    m = Mock()
+    add_feed(m, spec)
+
+    kind, args, kwargs = expected
+    getattr(m, kind).assert_called_once_with(*args, **kwargs)
+
+
+@pytest.mark.parametrize("spec", [dict(), dict(url="u", youtube="c")])
+def test_add_feed_needs_one_kind(spec):
+    with pytest.raises(ValueError):
+        add_feed(None, spec)
+
+
+def test_budget_option(config, tmp_path):
+    assert main(["-c", config, "--budget", "1m"]) == 0
+
+    assert len(os.listdir(tmp_path / "mail" / "new")) == 2
+
+
+def test_stats(config, capsys):
+    main(["-c", config])
+    capsys.readouterr()
+
+    assert main(["-c", config, "--stats"]) == 0
+
+    out = capsys.readouterr().out
+    assert "Feeds: 1\n" in out
+    assert "Due now: 0\n" in out
+    assert "Due in 1d: 1\n" in out
+    assert "       1  x-mrss\n" in out
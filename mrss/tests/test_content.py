@@ -0,0 +1,47 @@
+from mrss._content import *
+import pytest
+
+
+def test_strip_data_uris():
+    html = '<img src="data:image/png;base64,iVBORw0KGgo="><a href="http://x/">x</a>'
+
+    assert strip_data_uris(html) == '<img src=""><a href="http://x/">x</a>'
+
+
+def test_html_to_text():
+    html = """
+    <h1>Title</h1>
+    <p>Some   <b>bold</b> text.</p>
+    <script>alert(1)</script>
+    <ul><li>a</li><li>b &amp; c</li></ul>
+    """
+
+    assert html_to_text(html) == "Title\n\nSome bold text.\n\na\n\nb & c"
+
+
+@pytest.mark.parametrize("max_size", [5, 20, 30, 100])
+def test_truncate(max_size):
+    text = "árvíztűrő tükörfúrógép"
+
+    truncated = truncate(text, max_size, "http://x/")
+
+    assert len(truncated.encode()) <= max(max_size, len("\n\n[…] http://x/".encode()))
+    if max_size < len(text.encode()):
+        assert truncated.endswith("[…] http://x/")
+    else:
+        assert truncated == text
+
+
+def test_trim_content_keeps_small_html():
+    html = '<p><img src="data:image/png;base64,AAAA">text</p>'
+
+    assert trim_content(html, "html", 100) == ('<p><img src="">text</p>', "html")
+
+
+def test_trim_content_converts_oversized_html():
+    html = "<p>" + "x" * 100 + "</p>"
+
+    value, subtype = trim_content(html, "html", 50)
+
+    assert subtype == "plain"
+    assert value.startswith("x") and len(value.encode()) <= 50
@@ -1,5 +1,7 @@
+from datetime import datetime, timedelta, timezone
 from mrss._mixins import *
 from mrss._state import *
+from time import time
 from unittest.mock import Mock, patch
 import pytest
 
@@ -95,26 +97,27 @@ def test_user_agent_works(easy, monkeypatch):
         feedparser.USER_AGENT = "default"
 
         original = feedparser.parse
+        user_agents = []
 
         def mock(*args, **kwargs):
-            assert feedparser.USER_AGENT == expected_user_agent
+            user_agents.append(kwargs["agent"] or feedparser.USER_AGENT)
             return original(*args, **kwargs)
 
         monkeypatch.setattr(feedparser, "parse", mock)
 
-        expected_user_agent = "test assert"
-        with pytest.raises(AssertionError):
-            m.url(test_url)
+        def url(*args, **kwargs):
+            m.url(*args, **kwargs)
+            # Failed fetches are retried later.
+            m.state.get(test_url).expires = None
 
-        expected_user_agent = "default"
-        m.url(test_url)
+        url(test_url)
 
-        expected_user_agent = "UserAgentMixin"
-        m.USER_AGENT = expected_user_agent
-        m.url(test_url)
+        m.USER_AGENT = "UserAgentMixin"
+        url(test_url)
 
-        expected_user_agent = "parameter"
-        m.url(test_url, user_agent=expected_user_agent)
+        url(test_url, user_agent="parameter")
+
+    assert user_agents == ["default", "UserAgentMixin", "parameter"]
 
 
 def test_messages_are_not_updated(easy, static_feed):
@@ -164,12 +167,70 @@ def test_state_not_saved_on_error(easy, static_feed):
     ):
         with pytest.raises(RuntimeError):
             with easy as m:
-                m.parse(key="key", data=Mock(side_effect=RuntimeError))
+                m.parse(key="key", data=static_feed)
+                raise RuntimeError
 
         assert unlock.called
         assert not save.called
 
 
+def test_feed_error_does_not_abort_run(easy, static_feed):
+    with patch.object(easy.state, "save") as save:
+        with easy as m:
+            m.parse(key="bad", data=Mock(side_effect=RuntimeError("oops")))
+            m.parse(key="key", data=static_feed)
+
+        assert save.called
+
+    bad = easy.state.get("bad")
+    assert bad.failures == 1
+    assert bad.error == "oops"
+    assert len([*m.mailbox.keys()]) == 2
+
+
+def test_failures_back_off_exponentially(easy, static_feed):
+    broken = Mock(side_effect=RuntimeError)
+
+    with easy as m:
+        state = m.state.get("key")
+        for failures in (1, 2, 3):
+            state.expires = None
+            before = datetime.now(timezone.utc)
+            m.parse(key="key", data=broken)
+
+            assert state.failures == failures
+            assert state.expires >= before + m.BACKOFF * 2 ** (failures - 1)
+
+        state.expires = None
+        m.parse(key="key", data=static_feed)
+
+        assert state.failures == 0
+        assert state.error is None
+
+
+def test_too_many_requests_blocks_host(easy, monkeypatch):
+    import feedparser
+
+    result = feedparser.FeedParserDict(
+        status=429,
+        headers={"retry-after": "3600"},
+        feed=feedparser.FeedParserDict(),
+        entries=[],
+    )
+    parse = Mock(return_value=result)
+    monkeypatch.setattr(feedparser, "parse", parse)
+
+    with easy as m:
+        m.url("http://example.com/a")
+        m.url("http://example.com/b")
+
+        assert parse.call_count == 1
+        for key in ("http://example.com/a", "http://example.com/b"):
+            expires_in = m.state.get(key).expires - datetime.now(timezone.utc)
+            assert timedelta(minutes=59) < expires_in <= timedelta(hours=1)
+        assert m.state.get("http://example.com/b").failures == 0
+
+
 def test_state_not_saved_when_not_changed(easy, static_feed):
     with easy as m:
         m.parse(key="key", data=static_feed, expires=timedelta(1))
@@ -183,3 +244,195 @@ def test_state_not_saved_when_not_changed(easy, static_feed):
 
         assert unlock.called
         assert not save.called
+
+
+def test_collect_does_not_run(easy, static_feed):
+    jobs = easy.collect(lambda m: m.parse(key="key", data=static_feed))
+
+    assert [job.key for job in jobs] == ["key"]
+    assert not static_feed.called
+
+
+def test_run_forever_refetches_expired_feeds(easy, static_feed, monkeypatch):
+    sleeps = []
+    clock = [time()]
+
+    def sleep(secs):
+        sleeps.append(secs)
+        clock[0] += secs
+        if len(sleeps) == 2:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr("mrss._mailbox.sleep", sleep)
+    monkeypatch.setattr("mrss._mailbox.time", lambda: clock[0])
+
+    with (
+        patch.object(easy.state, "save") as save,
+        patch.object(easy.mailbox, "lock") as lock,
+    ):
+        with pytest.raises(KeyboardInterrupt):
+            easy.run_forever(lambda m: m.parse(key="key", data=static_feed))
+
+        assert static_feed.call_count == 2
+        assert lock.call_count == 2
+        assert save.called
+
+    # Not expiring feed is not fetched again before the interval.
+    assert 299 < sleeps[0] <= 300
+    assert len([*easy.mailbox.keys()]) == 2
+
+
+@pytest.mark.parametrize("seenfile, expected_count", ((None, 2), ("seen.gz", 1)))
+def test_seen_drops_syndicated_entries(tmp_path, seenfile, expected_count):
+    data = feed_data(1)
+    mirror = data.replace(b"http://example.com/path", b"http://mirror.example.org/")
+
+    with EasyMaildir(str(tmp_path), seenfile=seenfile) as m:
+        m.parse(key="key", data=lambda: data, reply_to=False)
+        m.parse(key="mirror", data=lambda: mirror, reply_to=False)
+
+        assert len([*m.mailbox.keys()]) == expected_count
+
+
+def test_seen_keeps_unrelated_entries_with_same_title(tmp_path):
+    data = feed_data(1)
+    other = data.replace(b"http://example.com/", b"http://example.org/")
+
+    with EasyMaildir(str(tmp_path), seenfile="seen.gz") as m:
+        m.parse(key="key", data=lambda: data, reply_to=False)
+        m.parse(key="other", data=lambda: other, reply_to=False)
+
+        assert len([*m.mailbox.keys()]) == 2
+
+
+def test_max_size_and_summary(easy):
+    data = feed_data(1).replace(b"Description", b"&lt;p&gt;" + b"x" * 1000)
+    other = data.replace(b"http://example.com/path", b"http://example.org/")
+
+    with easy as m:
+        m.parse(key="key", data=lambda: data, reply_to=False, max_size=100)
+        m.parse(key="other", data=lambda: other, reply_to=False, summary=True)
+
+        msgs = [m.mailbox[key] for key in m.mailbox.keys()]
+
+    msgs = {msg.get_content_type(): msg for msg in msgs}
+    assert len(msgs["text/plain"].get_payload()) <= 100
+    summary, html = msgs["multipart/alternative"].get_payload()
+    assert summary.get_payload().strip() == "x" * 1000
+    assert html.get_content_type() == "text/html"
+
+
+def test_progress_is_kept_on_error(easy, static_feed):
+    with pytest.raises(RuntimeError):
+        with easy as m:
+            m.parse(key="key", data=static_feed, expires=timedelta(1))
+            raise RuntimeError
+
+    with easy as m:
+        m.parse(key="key", data=static_feed)
+
+    assert static_feed.call_count == 1
+
+
+def test_stable_msgid_is_compatible():
+    from mrss._mailbox import Mailbox
+
+    assert (
+        Mailbox._make_stable_msgid("http://example.com/entry/1", "example.com")
+        == "<1b3ee0e6a4@example.com>"
+    )
+
+
+def test_cached_headers_are_shared(easy):
+    data = feed_data(2)
+
+    with easy as m:
+        m.parse(key="key", data=lambda: data, reply_to=False)
+
+        msgs = [m.mailbox[key] for key in m.mailbox.keys()]
+
+    assert len(msgs) == 3
+    for name in ("Received", "In-Reply-To", "From"):
+        (value,) = set(msg[name] for msg in msgs)
+        assert value
+    assert msgs[0]["Received"].startswith("mrss; ")
+
+
+def test_budget_runs_feeds_by_priority(easy, monkeypatch):
+    order = []
+
+    def feed(key):
+        return lambda: order.append(key) or feed_data(0)
+
+    easy.budget = timedelta(minutes=1)
+    with easy as m:
+        m.state.get("stale").expires = datetime(2000, 1, 1, tzinfo=timezone.utc)
+        m.state.get("fresh").expires = datetime(2001, 1, 1, tzinfo=timezone.utc)
+
+        m.parse(key="fresh", data=feed("fresh"))
+        m.parse(key="low", data=feed("low"), priority=-1)
+        m.parse(key="stale", data=feed("stale"))
+        m.parse(key="high", data=feed("high"), priority=1)
+
+        assert order == []
+
+    assert order == ["high", "stale", "fresh", "low"]
+
+
+def test_budget_defers_feeds(easy, monkeypatch):
+    import mrss._mailbox
+
+    clock = [0.0]
+    monkeypatch.setattr(mrss._mailbox, "monotonic", lambda: clock[0])
+
+    def slow():
+        clock[0] += 60
+        return feed_data(0)
+
+    easy.budget = timedelta(seconds=30)
+    with patch.object(easy.state, "save") as save:
+        with easy as m:
+            m.parse(key="first", data=slow, priority=1)
+            m.parse(key="deferred", data=slow)
+
+        assert save.called
+
+    assert easy.state.get("first").expires
+    assert easy.state.get("deferred").expires is None
+
+
+def test_budget_limits_socket_timeout(easy, monkeypatch):
+    import mrss._mailbox
+    import socket
+
+    clock = [0.0]
+    monkeypatch.setattr(mrss._mailbox, "monotonic", lambda: clock[0])
+    timeouts = []
+
+    def slow():
+        timeouts.append(socket.getdefaulttimeout())
+        clock[0] += 10
+        return feed_data(0)
+
+    easy.budget = timedelta(seconds=30)
+    with easy as m:
+        m.parse(key="first", data=slow, priority=1)
+        m.parse(key="second", data=slow)
+
+    assert timeouts == [30, 20]
+    assert socket.getdefaulttimeout() is None
+
+
+def test_budget_runs_with_workers(tmp_path):
+    from threading import current_thread, main_thread
+
+    threads = []
+
+    def feed():
+        threads.append(current_thread())
+        return feed_data(0)
+
+    with EasyMaildir(str(tmp_path), budget=timedelta(minutes=1), workers=2) as m:
+        m.parse(key="key", data=feed)
+
+    assert threads and main_thread() not in threads
@@ -22,3 +22,112 @@ def test_maildir_creates_subdirectories_when_some_exists(tmp_path):
 def test_maildir_creates_tail_directories_only(tmp_path):
     with pytest.raises(FileNotFoundError):
         Maildir(path=str(tmp_path / "no/such/dir"), state=DictState())
+
+
+@pytest.fixture
+def indexed(tmp_path):
+    from email.message import EmailMessage
+
+    m = Maildir(path=str(tmp_path), state=DictState())
+    for i in range(3):
+        msg = EmailMessage()
+        msg["Message-ID"] = f"<{i}@example.com>"
+        m.mailbox.add(msg)
+    return m
+
+
+def age_subdirs(path):
+    for subdir in ["cur", "new"]:
+        os.utime(path / subdir, ns=(0, 1_000_000_000))
+
+
+def test_index_is_saved(indexed, tmp_path):
+    with indexed as m:
+        m._update_msgids()
+
+    m._msgid2key = None
+    m._update_msgids()
+    assert set(m._msgid2key) == {f"<{i}@example.com>" for i in range(3)}
+    assert (tmp_path / "msgids.gz").exists()
+
+
+def test_index_skips_unchanged_directories(indexed, tmp_path, monkeypatch):
+    age_subdirs(tmp_path)
+    with indexed as m:
+        m._update_msgids()
+
+    monkeypatch.setattr(os, "listdir", pytest.fail)
+    monkeypatch.setattr(Maildir, "_read_msgid", pytest.fail)
+    with indexed as m:
+        m._update_msgids()
+
+        assert len(m._msgid2key) == 3
+
+
+def test_index_reads_new_messages_only(indexed, tmp_path, monkeypatch):
+    from email.message import EmailMessage
+
+    age_subdirs(tmp_path)
+    with indexed as m:
+        m._update_msgids()
+
+    msg = EmailMessage()
+    msg["Message-ID"] = "<new@example.com>"
+    new_key = indexed.mailbox.add(msg)
+
+    read = []
+    original = Maildir._read_msgid
+    monkeypatch.setattr(
+        Maildir,
+        "_read_msgid",
+        staticmethod(lambda path: read.append(path) or original(path)),
+    )
+    with indexed as m:
+        m._update_msgids()
+
+        assert [os.path.basename(x) for x in read] == [new_key]
+        assert m._msgid2key["<new@example.com>"] == new_key
+
+
+@pytest.mark.parametrize(
+    "corrupt",
+    [
+        lambda data: b"garbage",
+        lambda data: data[:-10],
+        lambda data: gzip.compress(b"1 2\nno tab\n"),
+    ],
+)
+def test_corrupt_index_is_rebuilt(indexed, tmp_path, corrupt):
+    age_subdirs(tmp_path)
+    with indexed as m:
+        m._update_msgids()
+
+    index = tmp_path / "msgids.gz"
+    index.write_bytes(corrupt(index.read_bytes()))
+
+    with indexed as m:
+        m._update_msgids()
+
+        assert len(m._msgid2key) == 3
+
+    with gzip.open(index) as f:
+        assert len(f.readlines()) == 4
+
+
+def test_index_is_saved_before_unlock(indexed, tmp_path, monkeypatch):
+    def unlock():
+        assert (tmp_path / "msgids.gz").exists()
+
+    monkeypatch.setattr(indexed.mailbox, "unlock", unlock)
+    with indexed as m:
+        m._update_msgids()
+
+    assert [x for x in os.listdir(tmp_path) if x.startswith("msgids")] == ["msgids.gz"]
+
+
+def test_index_can_be_disabled(tmp_path):
+    m = Maildir(path=str(tmp_path), state=DictState(), index=None)
+    with m:
+        m._update_msgids()
+
+    assert not (tmp_path / "msgids.gz").exists()
@@ -66,8 +66,9 @@ def test_mixins(name, args, reply_to, expires):
     expected_custom_arg = "Test custom"
 
     class TestAll(SitesMixin):
-        def url(self, url, *, expires, reply_to, custom_arg, name):
+        def url(self, url, *, expires, reply_to, custom_arg, name, priority):
             assert url
+            assert isinstance(priority, int)
             assert name == expected_name
             assert reply_to == expected_reply_to
             assert expires == expected_expires
@@ -86,7 +87,7 @@ def test_mixins(name, args, reply_to, expires):
     )
 
     class TestOptional(SitesMixin):
-        def url(self, url, *, expires, reply_to=None, name=None):
+        def url(self, url, *, expires, priority, reply_to=None, name=None):
             pass
 
     getattr(TestOptional(), name)(**args)
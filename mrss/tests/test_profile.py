@@ -0,0 +1,47 @@
+from mrss._mixins import EasyMaildir
+from mrss._profile import *
+from mrss.tests.test_mailbox import static_feed
+import pstats
+import pytest
+
+
+@pytest.mark.parametrize("cpu", [True, False])
+@pytest.mark.parametrize("memory", [True, False])
+def test_profiler_writes_report(tmp_path, cpu, memory):
+    p = Profiler(str(tmp_path), cpu=cpu, memory=memory)
+
+    p.start()
+    with p.feed("slow"):
+        data = [bytes(1000) for _ in range(100)]
+    with p.feed("fast"):
+        pass
+    p.stop()
+
+    (report,) = tmp_path.glob("*.txt")
+    lines = report.read_text().splitlines()
+    assert lines[1].endswith("  slow")
+    assert lines[2].endswith("  fast")
+    assert bool([*tmp_path.glob("*.pstats")]) == cpu
+    if memory:
+        assert 100_000 <= int(lines[1].split()[1])
+
+
+def test_mailbox_profile_from_environment(tmp_path, monkeypatch, static_feed):
+    monkeypatch.setenv("MRSS_PROFILE", str(tmp_path / "profile"))
+
+    with EasyMaildir(str(tmp_path / "mail")) as m:
+        m.parse(key="key", data=static_feed)
+
+    (report,) = (tmp_path / "profile").glob("*.txt")
+    assert "  key\n" in report.read_text()
+    (filename,) = (tmp_path / "profile").glob("*.pstats")
+    assert pstats.Stats(str(filename)).total_calls
+
+
+def test_mailbox_profile_disabled(tmp_path, monkeypatch):
+    monkeypatch.delenv("MRSS_PROFILE", raising=False)
+
+    m = EasyMaildir(str(tmp_path))
+
+    assert m.profiler is None
+    assert "_fetch" not in vars(m)
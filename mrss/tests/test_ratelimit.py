@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta, timezone
+from mrss._ratelimit import *
+import pytest
+
+
+def test_unlimited_does_not_wait(monkeypatch):
+    monkeypatch.setattr("mrss._ratelimit.sleep", pytest.fail)
+
+    r = RateLimiter()
+    for _ in range(10):
+        r.acquire("host")
+
+
+def test_acquire_waits_for_token(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr("mrss._ratelimit.sleep", sleeps.append)
+    monkeypatch.setattr("mrss._ratelimit.monotonic", lambda: 100.0)
+
+    r = RateLimiter(rate=2, burst=2)
+    for _ in range(4):
+        r.acquire("host")
+    r.acquire("other")
+
+    assert sleeps == [0.5, 1.0]
+
+
+def test_block_expires():
+    r = RateLimiter()
+    now = datetime.now(timezone.utc)
+
+    r.block("host", now + timedelta(hours=1))
+    r.block("host", now + timedelta(minutes=1))
+    r.block("gone", now - timedelta(minutes=1))
+
+    assert r.blocked_until("host") == now + timedelta(hours=1)
+    assert r.blocked_until("gone") is None
+    assert r.blocked_until("other") is None
@@ -0,0 +1,77 @@
+from mrss._mixins import EasyMaildir
+from mrss._replay import *
+from mrss.tests.test_mailbox import feed_data
+import pytest
+
+KEY = "http://example.com/feed.rss"
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = Archive(str(tmp_path / "archive"))
+    archive.put(KEY, 200, {"ETag": '"etag"'}, feed_data(1))
+    return archive
+
+
+def test_archive_roundtrip(archive):
+    assert KEY in archive
+    assert "other" not in archive
+    assert archive.get(KEY) == (200, {"ETag": '"etag"'}, feed_data(1))
+
+
+def test_record_shell_output(tmp_path):
+    archive = Archive(str(tmp_path))
+
+    result = Recorder(archive)("x-mrss:key", lambda: feed_data(1))
+
+    assert result.status == 200
+    assert len(result.entries) == 1
+    assert archive.get("x-mrss:key") == (200, {}, feed_data(1))
+
+
+@pytest.mark.parametrize("as_url", (False, True))
+def test_record_local_file(tmp_path, as_url):
+    archive = Archive(str(tmp_path / "archive"))
+    path = tmp_path / "feed.rss"
+    path.write_bytes(feed_data(1))
+    source = path.as_uri() if as_url else str(path)
+
+    result = Recorder(archive)("key", lambda: source)
+
+    assert len(result.entries) == 1
+    assert archive.get("key") == (200, {}, feed_data(1))
+
+
+def test_record_http(archive, tmp_path):
+    recorded = Archive(str(tmp_path / "recorded"))
+
+    with ReplayServer(archive) as server:
+        url = server.url + KEY.encode().hex()
+        result = Recorder(recorded)(url, lambda: url, agent="agent")
+
+    assert result.status == 200
+    assert result.etag == '"etag"'
+    status, headers, body = recorded.get(url)
+    assert (status, headers["ETag"], body) == (200, '"etag"', feed_data(1))
+
+
+def test_replay_malformed_path(archive):
+    from urllib.error import HTTPError
+    from urllib.request import urlopen
+
+    with ReplayServer(archive) as server:
+        with pytest.raises(HTTPError) as e:
+            urlopen(server.url + "zz")
+
+    assert e.value.code == 404
+
+
+def test_replay_through_mailbox(archive, tmp_path):
+    with ReplayServer(archive, latency=0.01, bandwidth=1e6) as replay:
+        with EasyMaildir(str(tmp_path / "mail"), fetcher=replay) as m:
+            m.url(KEY)
+            m.url("http://example.com/not-recorded")
+
+            assert len([*m.mailbox.keys()]) == 2
+            assert m.state.get(KEY).etag == '"etag"'
+            assert m.state.get("http://example.com/not-recorded").failures == 1
@@ -0,0 +1,88 @@
+from datetime import timedelta
+from mrss._seen import *
+import pytest
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        ("http://example.com/a/", "https://www.example.com/a"),
+        ("http://example.com/a?x=1&y=2", "http://example.com/a?y=2&x=1"),
+        ("http://example.com/a?utm_source=rss&fbclid=x", "http://example.com/a"),
+    ],
+)
+def test_normalize_link(a, b):
+    assert normalize_link(a) == normalize_link(b)
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        ("http://a/?p=1", "http://a/?p=2"),
+        ("http://a/?ref=x", "http://a/?ref=y"),
+        ("http://a/#x", "http://a/#y"),
+    ],
+)
+def test_normalize_link_keeps_distinct(a, b):
+    assert normalize_link(a) != normalize_link(b)
+
+
+def test_entry_fingerprints():
+    entry = dict(
+        link="http://example.com/a",
+        title="v1.0.0",
+        published_parsed=(2000, 1, 2, 3, 4, 5),
+    )
+    mirror = dict(link="https://www.example.com/a?utm_source=rss", title="Other")
+    # Same title on the same day.
+    other = entry | dict(link="http://example.com/b")
+
+    assert set(entry_fingerprints(entry)) == set(entry_fingerprints(mirror))
+    assert not set(entry_fingerprints(entry)) & set(entry_fingerprints(other))
+    assert entry_fingerprints(dict(title="No link")) == []
+
+
+def test_add_detects_other_sources_only():
+    s = SeenSet()
+    s.load()
+
+    assert not s.add("a", [1, 2])
+    assert not s.add("a", [1])
+    assert s.add("b", [2, 3])
+    assert s.add("b", [2])
+    assert not s.add("b", [3])
+
+
+def test_capacity_is_bounded():
+    s = SeenSet(capacity=2)
+    s.load()
+
+    s.add("a", [1])
+    s.add("a", [2])
+    s.add("a", [1])
+    s.add("a", [3])
+
+    assert set(s.store) == {1, 3}
+
+
+def test_save_and_load(tmp_path):
+    s = SeenSet(str(tmp_path / "seen.gz"))
+    s.load()
+    s.add("a", [1, 2])
+    s.save()
+
+    s.load()
+    assert set(s.store) == {1, 2}
+    assert s.add("b", [1])
+
+
+def test_old_fingerprints_expire(tmp_path, monkeypatch):
+    s = SeenSet(str(tmp_path / "seen.gz"), max_age=timedelta(days=1))
+    s.load()
+    s.add("a", [1])
+    s.save()
+
+    monkeypatch.setattr("mrss._seen.time", lambda: time() + 2 * 24 * 60 * 60)
+    s.load()
+
+    assert s.store == {}
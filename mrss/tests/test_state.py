@@ -77,3 +77,140 @@ def test_malformed_date_is_sound():
             modified="invalid date",
             etag="",
         )
+
+
+def test_gzip_load_old_format(tmp_path):
+    import gzip
+
+    filename = str(tmp_path / "old.gz")
+    with gzip.open(filename, mode="wt") as f:
+        f.write("key\tmodified\texpires\tetag\nkey\t\t\tetag\n")
+
+    s = GzipState(filename)
+    s.load()
+
+    assert s.get("key") == StateItem(key="key", etag="etag")
+
+
+def test_gzip_commit_survives_without_save(gzip_state):
+    from datetime import datetime, timezone
+
+    item = gzip_state.get("committed")
+    item.expires = datetime(2001, 1, 1, tzinfo=timezone.utc)
+    gzip_state.commit(item)
+    gzip_state.get("uncommitted")
+
+    s = GzipState(gzip_state.filename)
+    s.load()
+
+    assert s.store["committed"] == item
+    assert "uncommitted" not in s.store
+    assert len(s.store) == len(gzip_state.store) - 1
+
+
+def test_gzip_save_removes_log(gzip_state):
+    gzip_state.commit(gzip_state.get("key0"))
+    assert os.path.exists(gzip_state.log_filename)
+
+    gzip_state.save()
+
+    assert not os.path.exists(gzip_state.log_filename)
+
+
+def test_gzip_load_ignores_incomplete_log(gzip_state):
+    gzip_state.commit(StateItem(key="complete", etag="etag"))
+    with open(gzip_state.log_filename, "a") as f:
+        f.write("incomplete\tinvalid date")
+
+    gzip_state.load()
+
+    assert gzip_state.store["complete"].etag == "etag"
+    assert "incomplete" not in gzip_state.store
+
+
+@pytest.mark.parametrize("newline", ("", "\n"))
+def test_gzip_load_ignores_torn_record(gzip_state, newline):
+    gzip_state.commit(StateItem(key="complete", etag="etag"))
+    with open(gzip_state.log_filename) as f:
+        log = f.read()
+    torn = 'http://example.com\t\t\t"etag"\t1\terror\n'
+    keys = set(gzip_state.store) | {"complete"}
+
+    # Cut after the last tab is a valid record with a shorter error.
+    for i in range(1, torn.rindex("\t") if newline else len(torn) - 1):
+        with open(gzip_state.log_filename, "w") as f:
+            f.write(log + torn[:i] + newline)
+
+        gzip_state.load()
+
+        assert set(gzip_state.store) == keys, torn[:i]
+        assert gzip_state.store["complete"].etag == "etag"
+
+        # Crashed again before save.
+        gzip_state.commit(StateItem(key="http://c.example/feed", etag="c"))
+        s = GzipState(gzip_state.filename)
+        s.load()
+
+        assert set(s.store) == keys | {"http://c.example/feed"}, torn[:i]
+        assert s.store["http://c.example/feed"].etag == "c"
+
+
+def test_columns(dict_state):
+    from datetime import datetime, timedelta, timezone
+
+    now = datetime(2000, 1, 1, tzinfo=timezone.utc)
+    for key, expires_in in [
+        ("http://a.example/1", None),
+        ("http://a.example/2", timedelta(hours=-1)),
+        ("http://a.example/3", timedelta(hours=2)),
+        ("https://b.example/", timedelta(days=2)),
+        ("x-mrss:cmd", timedelta(minutes=30)),
+    ]:
+        item = dict_state.get(key)
+        item.expires = expires_in and now + expires_in
+        item.modified = now - timedelta(days=1)
+    dict_state.get("x-mrss:cmd").failures = 2
+
+    c = dict_state.columns()
+    ts = now.timestamp()
+
+    assert len(c) == 5
+    assert c.due(now=ts) == ["http://a.example/1", "http://a.example/2"]
+    assert c.count_due(timedelta(hours=1), now=ts) == 3
+    assert c.count_due(timedelta(days=7), now=ts) == 5
+    assert c.host_counts() == {"a.example": 3, "b.example": 1, "x-mrss": 1}
+    assert c.host_counts(timedelta(hours=3), now=ts) == {"a.example": 3, "x-mrss": 1}
+    assert list(c.modified_ages(now=ts)) == [24 * 60 * 60] * 5
+    assert c.failing() == ["x-mrss:cmd"]
+    assert c.hosts[0] is c.hosts[1]
+
+    # Same answers from the built expires column.
+    assert len(c.expires) == 5
+    assert c.due(now=ts) == ["http://a.example/1", "http://a.example/2"]
+    assert c.count_due(timedelta(hours=1), now=ts) == 3
+
+
+def test_columns_of_keys(dict_state):
+    dict_state.get("old")
+
+    c = dict_state.columns(["new"])
+
+    assert c.keys == ["new"]
+    assert c.due() == ["new"]
+
+
+def test_custom_state_has_columns():
+    class S(State):
+        def load(self):
+            self.store = {}
+
+        def save(self):
+            pass
+
+        def get(self, key):
+            return self.store.setdefault(key, StateItem(key=key))
+
+    s = S()
+    s.load()
+
+    assert s.columns(["a", "b"]).due() == ["a", "b"]
@@ -18,3 +18,23 @@ import pytest
 )
 def test_human_duration(duration, expected):
     assert human_duration(duration.total_seconds()) == expected
+
+
+@pytest.mark.parametrize(
+    "duration, expected",
+    [
+        ("1d", timedelta(days=1)),
+        ("1d 3s", timedelta(days=1, seconds=3)),
+        ("2w 10s", timedelta(days=14, seconds=10)),
+        ("12h", timedelta(hours=12)),
+        ("0s", timedelta(0)),
+    ],
+)
+def test_parse_duration(duration, expected):
+    assert parse_duration(duration) == expected.total_seconds()
+
+
+@pytest.mark.parametrize("duration", ["", "1", "d", "1x", "-1d"])
+def test_parse_duration_invalid(duration):
+    with pytest.raises(ValueError):
+        parse_duration(duration)